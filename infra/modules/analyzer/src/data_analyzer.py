@@ -1,41 +1,166 @@
 import json
 import boto3
+from botocore.config import Config
 import logging
 import datetime
 import uuid
-import statistics
+import math
 import os
 import time
+from collections import defaultdict
+from decimal import Decimal
 
 # Logging setup
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 class JSONFormatter(logging.Formatter):
+    # Date/time part of the last formatted second; bursts of log lines reuse it
+    _cached_second = None
+    _cached_prefix = ""
+
+    def _timestamp(self, created):
+        second = int(created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_prefix = datetime.datetime.utcfromtimestamp(second).strftime("%Y-%m-%dT%H:%M:%S")
+        return f"{self._cached_prefix}.{int((created - second) * 1e6):06d}"
+
     def format(self, record):
-        log_entry = {
-            "timestamp": datetime.datetime.utcnow().isoformat(),
+        # record.created is stamped by logging itself; no need to read the clock again
+        return json.dumps({
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "message": record.getMessage(),
             "correlation_id": getattr(record, "correlation_id", None),
-        }
-        return json.dumps(log_entry)
+        })
 
 handler = logging.StreamHandler()
 handler.setFormatter(JSONFormatter())
 logger.addHandler(handler)
 
-# AWS clients
-
-
-# bedrock = boto3.client("bedrock-runtime")
+# The Lambda runtime installs its own root handler before this module is imported;
+# strip its "[LEVEL]\t<timestamp>\t<request id>" prefix once, here, rather than per invocation
+_runtime_handler = next((h for h in logger.handlers if h is not handler and h.formatter is not None), None)
+if _runtime_handler is not None:
+    _runtime_handler.formatter._style._fmt = "%(message)s"
 
 TABLE_NAME = os.getenv("TABLE_NAME")
-
-def compute_metrics(values):
+# Read size for streaming S3 bodies; botocore's 1 KiB default means many tiny reads
+_S3_CHUNK_SIZE = 64 * 1024
+
+# AWS clients, lazily created on first use and kept at module scope so warm invocations reuse them
+_CLIENT_CONFIG = Config(tcp_keepalive=True, max_pool_connections=10)
+_BEDROCK = None
+_CLOUDWATCH = None
+_S3 = None
+_DDB_TABLE = None
+
+def _bedrock():
+    global _BEDROCK
+    if _BEDROCK is None:
+        _BEDROCK = boto3.client("bedrock-runtime", config=_CLIENT_CONFIG)
+    return _BEDROCK
+
+def _cloudwatch():
+    global _CLOUDWATCH
+    if _CLOUDWATCH is None:
+        _CLOUDWATCH = boto3.client("cloudwatch", config=_CLIENT_CONFIG)
+    return _CLOUDWATCH
+
+def _s3():
+    global _S3
+    if _S3 is None:
+        _S3 = boto3.client("s3", config=_CLIENT_CONFIG)
+    return _S3
+
+def _table():
+    global _DDB_TABLE
+    if _DDB_TABLE is None:
+        if not TABLE_NAME:
+            raise ValueError("TABLE_NAME environment variable is required")
+        _DDB_TABLE = boto3.resource("dynamodb", config=_CLIENT_CONFIG).Table(TABLE_NAME)
+    return _DDB_TABLE
+
+# Per-bar prompt line; values are already numeric (see _coerce_ohlcv)
+_OHLCV_FMT = "{}: O${:.2f}/H${:.2f}/L${:.2f}/C${:.2f} (vol {:.2f}M)".format
+
+# Static Bedrock instructions; built once at import and reused on warm invocations
+_PROMPT_PREAMBLE = (
+    "You are an expert stock market analyst. Your task is to provide deep, actionable natural language analysis for each stock symbol based on the given metrics and recent OHLCV data. "
+    "Focus on synthesizing patterns, implications, and trader-relevant narratives—do not simply restate or copy the raw data, metrics, or anomalies. Instead, interpret them to create original insights.\n\n"
+    "Output a valid JSON object with:\n"
+    "- A top-level 'executive_summary': A detailed 3-5 sentence paragraph (150-250 words) consolidating the full analysis. Synthesize overall market sentiment from trends and aggregates, highlight standout symbols (e.g., top gainers/losers, anomalies), weave in key opportunities and risks across all symbols, and provide actionable trading implications. Reference aggregates explicitly for context (e.g., 'with average volume at X M shares'). Make it cohesive, high-level, and executive-ready—cover bullish/bearish signals, turbulence levels, and strategic recommendations.\n"
+    "- 'symbols': a dictionary where each key is a stock symbol and the value is an object with:\n"
+    "  - 'summary': 2-3 sentences analyzing the stock's recent behavior, such as evolving trends, volume implications, or event impacts. Infer broader context (e.g., 'This surge aligns with sector momentum'). Reference key dates/values sparingly and only to support analysis.\n"
+    "  - 'opportunities': 1-2 sentences outlining specific trading strategies or entry/exit points derived from the data patterns (e.g., 'Consider scaling in above $X if volume holds'). Avoid generic advice.\n"
+    "  - 'risks': 1-2 sentences detailing potential downside scenarios tied to the data (e.g., 'A failure to hold $Y could trigger a 5% pullback'). Avoid generic warnings.\n"
+    "  - 'key_anomaly': A single sentence flagging the most critical anomaly (if any) and its trading implication, or 'None' if no significant anomalies.\n\n"
+    "Guidelines:\n"
+    "- Synthesize: Connect metrics (e.g., high volatility + uptrend = 'volatile breakout potential') without quoting numbers verbatim.\n"
+    "- Trader-focused: Emphasize implications for positions, not just descriptions.\n"
+    "- Original: Do not copy prompt data or use example-like phrasing; create fresh analysis per symbol.\n"
+    "- Concise yet insightful: Use simple language, but demonstrate expertise through pattern recognition.\n"
+    "- For executive_summary: Ensure it's comprehensive—integrate insights from ALL symbols and aggregates into a unified narrative, not a bullet list or one-liner.\n"
+    "- JSON only: Return solely the JSON in ```json ... ``` format. No extra text.\n\n"
+    "Structure example (interpret, don't copy):\n"
+    "```json\n"
+    "{\n"
+    "  \"executive_summary\": \"The market demonstrated resilient bullish undertones despite pockets of volatility, with four out of six major tech stocks maintaining upward trajectories amid moderate turbulence from two anomalous performers. TSLA's explosive momentum led the pack as the top gainer with a 12.85% surge, signaling strong sector confidence, while GOOG's record high underscores sustained innovation-driven gains; however, AAPL and AMZN's downtrends highlight earnings-related caution in consumer tech. Aggregates reveal average trading volume of 219.01M shares across the portfolio, with TSLA's elevated volatility (stddev 26.69) offering high-reward opportunities but demanding tight risk management—traders should prioritize momentum plays in uptrending names like MSFT and META, scaling in on dips while setting stops below recent supports to navigate potential reversals in anomalous stocks.\",\n"
+    "  \"symbols\": {\n"
+    "    \"AAPL\": {\n"
+    "      \"summary\": \"The stock's recent decline suggests investor caution ahead of earnings, with a notable drop in volume indicating a lack of conviction in the current downtrend.\",\n"
+    "      \"opportunities\": \"Consider a short-term bounce if broader market indices stabilize, targeting a quick 2% upside.\",\n"
+    "      \"risks\": \"A continued drop below recent lows could signal deeper sector-wide issues.\",\n"
+    "      \"key_anomaly\": \"None\"\n"
+    "    }\n"
+    "  }\n"
+    "}\n"
+    "```\n\n"
+    "Aggregates for context (use in executive_summary):\n"
+)
+
+_PROMPT_CLOSING = (
+    "Generate original, comprehensive analysis. "
+    "The executive_summary must consolidate ALL symbol insights with aggregates into a detailed, flowing paragraph (150-250 words). "
+    "Output only the JSON."
+)
+
+def _stdev5(c0, c1, c2, c3, c4):
+    """Sample standard deviation of exactly five values, unrolled (two-pass)."""
+    m = (c0 + c1 + c2 + c3 + c4) * 0.2
+    return math.sqrt(((c0 - m) ** 2 + (c1 - m) ** 2 + (c2 - m) ** 2 + (c3 - m) ** 2 + (c4 - m) ** 2) * 0.25)
+
+def _any_diff5(a):
+    """True if the first five values are not all equal; short-circuits on the first difference."""
+    return a[0] != a[1] or a[0] != a[2] or a[0] != a[3] or a[0] != a[4]
+
+def _metrics_kernel(closes, volumes):
+    """Numeric core of compute_metrics over newest-first closes/volumes."""
+    latest_close = closes[0] if closes else None
+    prev_close = closes[1] if len(closes) > 1 else latest_close
+    momentum = latest_close - closes[4] if len(closes) >= 5 else None
+    avg_close = sum(closes[:5]) / 5 if len(closes) >= 5 else None
+    percent_change = ((latest_close - prev_close) / prev_close * 100) if prev_close and prev_close != 0 else 0
+
+    volatility = 0
+    if len(closes) >= 5 and _any_diff5(closes):  # Avoid stdev on identical values
+        volatility = _stdev5(closes[0], closes[1], closes[2], closes[3], closes[4])
+
+    avg_vol = sum(volumes) / len(volumes) if volumes else 0
+    latest_vol = volumes[0] if volumes else 0
+    return latest_close, prev_close, momentum, volatility, avg_vol, latest_vol, avg_close, percent_change
+
+def _coerce_ohlcv(record):
+    """Convert a record's OHLCV fields to float/int in place, once at ingest."""
+    for field in ("open", "high", "low", "close"):
+        record[field] = float(record.get(field, 0))
+    record["volume"] = int(record.get("volume", 0))
+
+def compute_metrics(values, correlation_id=None):
     """Compute key metrics from OHLCV data."""
     if not values:
-        logger.warning("No values provided for metrics computation", extra={"correlation_id": getattr(logger, "correlation_id", None)})
+        logger.warning("No values provided for metrics computation", extra={"correlation_id": correlation_id})
         return {
             "latest_close": None,
             "trend": "flat",
@@ -46,29 +171,27 @@ def compute_metrics(values):
             "percent_change": 0.0
         }
     try:
-        closes = [float(v.get("close", 0)) for v in values]  # Default to 0 if missing
-        volumes = [int(v.get("volume", 0)) for v in values]  # Default to 0 if missing
-        dates = [v.get("datetime", "") for v in values]      # Default to empty if missing
-
-        latest_close = closes[0] if closes else None
-        prev_close = closes[1] if len(closes) > 1 else latest_close
+        # Single pass over the records; missing fields default to 0
+        closes = []
+        volumes = []
+        for v in values:
+            closes.append(float(v.get("close", 0)))
+            volumes.append(int(v.get("volume", 0)))
+        # Every anomaly refers to the latest bar, so resolve its date label once
+        date_str = values[0].get("datetime", "") or "unknown date"
+
+        (latest_close, prev_close, momentum, volatility,
+         avg_vol, latest_vol, avg_close, percent_change) = _metrics_kernel(closes, volumes)
         trend = "up" if latest_close and prev_close and latest_close > prev_close else "down" if latest_close and prev_close and latest_close < prev_close else "flat"
-        momentum = latest_close - closes[4] if len(closes) >= 5 else None
-        volatility = statistics.stdev(closes[:5]) if len(closes) >= 5 and len(set(closes[:5])) > 1 else 0  # Avoid stdev on identical values
-        avg_vol = statistics.mean(volumes) if volumes else 0
-        latest_vol = volumes[0] if volumes else 0
-        percent_change = ((latest_close - prev_close) / prev_close * 100) if prev_close and prev_close != 0 else 0
         anomalies = []
         if latest_vol > 1.5 * avg_vol:
-            anomalies.append(f"Unusual trading volume on {dates[0] or 'unknown date'}")
+            anomalies.append(f"Unusual trading volume on {date_str}")
         if latest_close and prev_close and abs(latest_close - prev_close) > 0.05 * prev_close:
-            anomalies.append(f"Sharp price movement on {dates[0] or 'unknown date'}")
+            anomalies.append(f"Sharp price movement on {date_str}")
         if len(closes) >= 5:
-            recent_closes = closes[:5]
-            avg_close = statistics.mean(recent_closes)
-            stdev_close = statistics.stdev(recent_closes) if len(set(recent_closes)) > 1 else 0
-            if stdev_close > 0 and latest_close > avg_close + 2 * stdev_close:
-                anomalies.append(f"Record high close on {dates[0] or 'unknown date'}")
+            # volatility is already the stdev of the same 5-period window
+            if volatility > 0 and latest_close > avg_close + 2 * volatility:
+                anomalies.append(f"Record high close on {date_str}")
         return {
             "latest_close": round(latest_close, 2) if latest_close is not None else None,
             "trend": trend,
@@ -79,7 +202,7 @@ def compute_metrics(values):
             "percent_change": round(percent_change, 2)
         }
     except Exception as e:
-        logger.error(f"Failed to compute metrics: {str(e)}", extra={"correlation_id": getattr(logger, "correlation_id", None)})
+        logger.error(f"Failed to compute metrics: {str(e)}", extra={"correlation_id": correlation_id})
         return {
             "latest_close": None,
             "trend": "unknown",
@@ -93,125 +216,118 @@ def compute_metrics(values):
 def compute_aggregates(symbol_data):
     """Compute aggregate metrics across all symbols."""
     aggregates = []
-    trends = [data["metrics"]["trend"] for data in symbol_data.values() if "metrics" in data]
-    momentums = [data["metrics"]["momentum"] for data in symbol_data.values() if "metrics" in data and data["metrics"]["momentum"] is not None]
-    volatilities = [data["metrics"]["volatility"] for data in symbol_data.values() if "metrics" in data]
-    percent_changes = [data["metrics"]["percent_change"] for data in symbol_data.values() if "metrics" in data]
-    anomalies = [anomaly for data in symbol_data.values() if "metrics" in data for anomaly in data["metrics"]["anomalies"]]
-    volumes = [v for data in symbol_data.values() if "metrics" in data for v in [int(x["volume"]) for x in data["values"] if "volume" in x]]
+    trend_counts = {"up": 0, "down": 0, "flat": 0}
+    trend_total = 0
+    anomalies_total = 0
+    symbols_with_anomalies = 0
+    volume_total = 0
+    volume_count = 0
+    max_momentum, max_momentum_symbol = None, "unknown"
+    max_change, max_change_symbol, max_change_signed = None, "unknown", 0.0
+    max_volatility, max_volatility_symbol = None, "unknown"
+
+    # Single pass over symbols, tracking each argmax alongside its value
+    for symbol, data in symbol_data.items():
+        metrics = data.get("metrics")
+        if metrics is None:
+            continue
+        trend = metrics["trend"]
+        trend_total += 1
+        if trend in trend_counts:
+            trend_counts[trend] += 1
+        if metrics["anomalies"]:
+            anomalies_total += len(metrics["anomalies"])
+            symbols_with_anomalies += 1
+
+        momentum = metrics["momentum"]
+        if momentum is not None and (max_momentum is None or momentum > max_momentum):
+            max_momentum, max_momentum_symbol = momentum, symbol
+
+        percent_change = metrics["percent_change"]
+        if max_change is None or abs(percent_change) > max_change:
+            max_change, max_change_symbol, max_change_signed = abs(percent_change), symbol, percent_change
+
+        volatility = metrics["volatility"]
+        if max_volatility is None or volatility > max_volatility:
+            max_volatility, max_volatility_symbol = volatility, symbol
+
+        # Re-weight the per-symbol mean instead of re-reading every bar's volume
+        n_bars = len(data["values"])
+        volume_total += metrics["avg_volume"] * n_bars
+        volume_count += n_bars
 
     # Average volume
-    avg_volume = statistics.mean(volumes) if volumes else 0
+    avg_volume = volume_total / volume_count if volume_count else 0
     aggregates.append(f"Average trading volume across {len(symbol_data)} stocks was {avg_volume/1e6:.2f}M shares.")
 
     # Largest momentum
-    if momentums:
-        max_momentum = max(momentums)
-        max_momentum_symbol = next((s for s, d in symbol_data.items() if "metrics" in d and d["metrics"]["momentum"] == max_momentum), "unknown")
+    if max_momentum is not None:
         aggregates.append(f"{max_momentum_symbol} had the largest momentum with a {max_momentum:.2f} price change.")
 
     # Largest % change
-    if percent_changes:
-        max_change = max(abs(pc) for pc in percent_changes)
-        max_change_symbol = next((s for s, d in symbol_data.items() if "metrics" in d and abs(d["metrics"]["percent_change"]) == max_change), "unknown")
-        direction = "gainer" if percent_changes[percent_changes.index(max_change)] > 0 else "loser"
+    if max_change is not None:
+        direction = "gainer" if max_change_signed > 0 else "loser"
         aggregates.append(f"{max_change_symbol} was the biggest {direction} with a {max_change:.2f}% change.")
 
     # Number of symbols with anomalies
-    symbols_with_anomalies = sum(1 for data in symbol_data.values() if "metrics" in data and data["metrics"]["anomalies"])
     aggregates.append(f"{symbols_with_anomalies} of {len(symbol_data)} stocks showed anomalies, indicating {'high' if symbols_with_anomalies/len(symbol_data) > 0.5 else 'moderate'} market turbulence.")
 
     # Overall market trend
-    trend_counts = {"up": trends.count("up"), "down": trends.count("down"), "flat": trends.count("flat")}
     majority_trend = max(trend_counts, key=trend_counts.get, default="unknown")
-    aggregates.append(f"The majority of stocks ({trend_counts.get(majority_trend, 0)}/{len(trends)}) trended {majority_trend}, reflecting {'bullish' if majority_trend == 'up' else 'bearish' if majority_trend == 'down' else 'stable' if majority_trend == 'flat' else 'unclear'} market sentiment.")
+    aggregates.append(f"The majority of stocks ({trend_counts.get(majority_trend, 0)}/{trend_total}) trended {majority_trend}, reflecting {'bullish' if majority_trend == 'up' else 'bearish' if majority_trend == 'down' else 'stable' if majority_trend == 'flat' else 'unclear'} market sentiment.")
 
     # Highest volatility
-    if volatilities:
-        max_volatility = max(volatilities)
-        max_volatility_symbol = next((s for s, d in symbol_data.items() if "metrics" in d and d["metrics"]["volatility"] == max_volatility), "unknown")
+    if max_volatility is not None:
         aggregates.append(f"{max_volatility_symbol} had the highest volatility (stddev {max_volatility:.2f}), suggesting potential for large gains or losses.")
 
     # Total anomalies
-    aggregates.append(f"{len(anomalies)} total anomalies detected across all stocks, signaling {'significant' if len(anomalies) > len(symbol_data) else 'moderate'} market activity.")
+    aggregates.append(f"{anomalies_total} total anomalies detected across all stocks, signaling {'significant' if anomalies_total > len(symbol_data) else 'moderate'} market activity.")
 
     return aggregates
 
 def call_bedrock(symbol_data, aggregates, correlation_id, context):
     """Call Bedrock for per-symbol analysis and comprehensive executive summary."""
-    bedrock = boto3.client("bedrock-runtime")
-    cloudwatch = boto3.client('cloudwatch')
+    bedrock = _bedrock()
+    cloudwatch = _cloudwatch()
     retry_count = 0
     delay = 1 # Initial delay in seconds for exponential backoff
     max_retries = 5
+
+    # The prompt does not depend on retry state, so build it once up front
+    parts = [_PROMPT_PREAMBLE, "\n".join(aggregates), "\n\nAnalyze these symbols:\n"]
+    for symbol, data in symbol_data.items():
+        if "metrics" not in data:
+            logger.warning(f"Missing metrics for symbol {symbol}", extra={"correlation_id": correlation_id})
+            continue
+        metrics = data["metrics"]
+        interval = data.get("interval", "unknown")
+        all_values = data["values"]  # Already sorted newest first in lambda_handler
+
+        if len(all_values) > 50:
+            all_values = all_values[:52]
+            logger.warning(f"Truncated {symbol} values to 52 points for prompt limit", extra={"correlation_id": correlation_id})
+
+        parts.extend([
+            f"--- {symbol} ({interval} interval) ---\n",
+            f"Metrics (based on all available {interval} data):\n",
+            f"  Trend direction: {metrics['trend']}\n",
+            f"  Momentum over last 5 {interval} periods: {metrics['momentum'] if metrics['momentum'] is not None else 'Insufficient data'}\n",
+            f"  Volatility (stddev of last 5 {interval} periods): {metrics['volatility']:.2f}\n",
+            f"  Recent percent change: {metrics['percent_change']:.2f}%\n",
+            f"  Average volume: {metrics['avg_volume']/1e6:.2f}M shares\n",
+            f"  Detected anomalies: {', '.join(metrics['anomalies']) if metrics['anomalies'] else 'None'}\n",
+            f"Full {interval} OHLCV data points (all available, sorted newest first):\n",
+            ", ".join([
+                _OHLCV_FMT(v["datetime"][:10], v["open"], v["high"], v["low"], v["close"], v["volume"] / 1e6)
+                for v in all_values
+            ]),
+            "\n\n",
+        ])
+    parts.append(_PROMPT_CLOSING)
+    prompt = "".join(parts)
+
     while retry_count < max_retries:
         try:
-            prompt = (
-                "You are an expert stock market analyst. Your task is to provide deep, actionable natural language analysis for each stock symbol based on the given metrics and recent OHLCV data. "
-                "Focus on synthesizing patterns, implications, and trader-relevant narratives—do not simply restate or copy the raw data, metrics, or anomalies. Instead, interpret them to create original insights.\n\n"
-                "Output a valid JSON object with:\n"
-                "- A top-level 'executive_summary': A detailed 3-5 sentence paragraph (150-250 words) consolidating the full analysis. Synthesize overall market sentiment from trends and aggregates, highlight standout symbols (e.g., top gainers/losers, anomalies), weave in key opportunities and risks across all symbols, and provide actionable trading implications. Reference aggregates explicitly for context (e.g., 'with average volume at X M shares'). Make it cohesive, high-level, and executive-ready—cover bullish/bearish signals, turbulence levels, and strategic recommendations.\n"
-                "- 'symbols': a dictionary where each key is a stock symbol and the value is an object with:\n"
-                "  - 'summary': 2-3 sentences analyzing the stock's recent behavior, such as evolving trends, volume implications, or event impacts. Infer broader context (e.g., 'This surge aligns with sector momentum'). Reference key dates/values sparingly and only to support analysis.\n"
-                "  - 'opportunities': 1-2 sentences outlining specific trading strategies or entry/exit points derived from the data patterns (e.g., 'Consider scaling in above $X if volume holds'). Avoid generic advice.\n"
-                "  - 'risks': 1-2 sentences detailing potential downside scenarios tied to the data (e.g., 'A failure to hold $Y could trigger a 5% pullback'). Avoid generic warnings.\n"
-                "  - 'key_anomaly': A single sentence flagging the most critical anomaly (if any) and its trading implication, or 'None' if no significant anomalies.\n\n"
-                "Guidelines:\n"
-                "- Synthesize: Connect metrics (e.g., high volatility + uptrend = 'volatile breakout potential') without quoting numbers verbatim.\n"
-                "- Trader-focused: Emphasize implications for positions, not just descriptions.\n"
-                "- Original: Do not copy prompt data or use example-like phrasing; create fresh analysis per symbol.\n"
-                "- Concise yet insightful: Use simple language, but demonstrate expertise through pattern recognition.\n"
-                "- For executive_summary: Ensure it's comprehensive—integrate insights from ALL symbols and aggregates into a unified narrative, not a bullet list or one-liner.\n"
-                "- JSON only: Return solely the JSON in ```json ... ``` format. No extra text.\n\n"
-                "Structure example (interpret, don't copy):\n"
-                "```json\n"
-                "{\n"
-                "  \"executive_summary\": \"The market demonstrated resilient bullish undertones despite pockets of volatility, with four out of six major tech stocks maintaining upward trajectories amid moderate turbulence from two anomalous performers. TSLA's explosive momentum led the pack as the top gainer with a 12.85% surge, signaling strong sector confidence, while GOOG's record high underscores sustained innovation-driven gains; however, AAPL and AMZN's downtrends highlight earnings-related caution in consumer tech. Aggregates reveal average trading volume of 219.01M shares across the portfolio, with TSLA's elevated volatility (stddev 26.69) offering high-reward opportunities but demanding tight risk management—traders should prioritize momentum plays in uptrending names like MSFT and META, scaling in on dips while setting stops below recent supports to navigate potential reversals in anomalous stocks.\",\n"
-                "  \"symbols\": {\n"
-                "    \"AAPL\": {\n"
-                "      \"summary\": \"The stock's recent decline suggests investor caution ahead of earnings, with a notable drop in volume indicating a lack of conviction in the current downtrend.\",\n"
-                "      \"opportunities\": \"Consider a short-term bounce if broader market indices stabilize, targeting a quick 2% upside.\",\n"
-                "      \"risks\": \"A continued drop below recent lows could signal deeper sector-wide issues.\",\n"
-                "      \"key_anomaly\": \"None\"\n"
-                "    }\n"
-                "  }\n"
-                "}\n"
-                "```\n\n"
-                "Aggregates for context (use in executive_summary):\n"
-                f"{chr(10).join(aggregates)}\n\n"
-                "Analyze these symbols:\n"
-            )
-            for symbol, data in symbol_data.items():
-                if "metrics" not in data:
-                    logger.warning(f"Missing metrics for symbol {symbol}", extra={"correlation_id": correlation_id})
-                    continue
-                metrics = data["metrics"]
-                interval = data.get("interval", "unknown")
-                all_values = sorted(data["values"], key=lambda x: x["datetime"], reverse=True)
-
-                if len(all_values) > 50:
-                    all_values = all_values[:52]
-                    logger.warning(f"Truncated {symbol} values to 52 points for prompt limit", extra={"correlation_id": correlation_id})
-
-                prompt += f"--- {symbol} ({interval} interval) ---\n"
-                prompt += f"Metrics (based on all available {interval} data):\n"
-                prompt += f"  Trend direction: {metrics['trend']}\n"
-                prompt += f"  Momentum over last 5 {interval} periods: {metrics['momentum'] if metrics['momentum'] is not None else 'Insufficient data'}\n"
-                prompt += f"  Volatility (stddev of last 5 {interval} periods): {metrics['volatility']:.2f}\n"
-                prompt += f"  Recent percent change: {metrics['percent_change']:.2f}%\n"
-                prompt += f"  Average volume: {metrics['avg_volume']/1e6:.2f}M shares\n"
-                prompt += f"  Detected anomalies: {', '.join(metrics['anomalies']) if metrics['anomalies'] else 'None'}\n"
-                prompt += f"Full {interval} OHLCV data points (all available, sorted newest first):\n"
-                prompt += ", ".join([
-                    f"{v['datetime'][:10]}: O${float(v.get('open', 0)):.2f}/H${float(v.get('high', 0)):.2f}/L${float(v.get('low', 0)):.2f}/C${float(v.get('close', 0)):.2f} (vol {int(v.get('volume', 0))/1e6:.2f}M)"
-                    for v in all_values
-                ]) + "\n\n"
-            prompt += (
-                "Generate original, comprehensive analysis. "
-                "The executive_summary must consolidate ALL symbol insights with aggregates into a detailed, flowing paragraph (150-250 words). "
-                "Output only the JSON."
-            )
-
             response = bedrock.converse(
                 modelId="amazon.nova-lite-v1:0",
                 messages=[{"role": "user", "content": [{"text": prompt}]}],
@@ -224,28 +340,10 @@ def call_bedrock(symbol_data, aggregates, correlation_id, context):
             output = json.loads(output_text)
             logger.info(f"Bedrock analysis completed successfully", extra={"correlation_id": correlation_id})
             return output
-            # try:
-            #     output = json.loads(output_text)
-            #     # Validate structure
-            #     if "executive_summary" not in output:
-            #         raise ValueError("Missing 'executive_summary' in output")
-            #     if "symbols" not in output or not isinstance(output["symbols"], dict):
-            #         raise ValueError("Invalid JSON structure: Missing 'symbols' key or not a dict")
-            #     for symbol in output["symbols"]:
-            #         if symbol not in symbol_data:
-            #             raise ValueError(f"Unexpected symbol {symbol} in output")
-            #         sym_out = output["symbols"][symbol]
-            #         required_keys = ["summary", "opportunities", "risks", "key_anomaly"]
-            #         if not all(k in sym_out for k in required_keys):
-            #             raise ValueError(f"Missing required keys in {symbol}: {required_keys}")
-            #     logger.info(f"Bedrock analysis completed successfully", extra={"correlation_id": correlation_id})
         except json.JSONDecodeError as e:
                 logger.error(f"JSONDecodeError parsing Bedrock output: {str(e)}. Raw output: {output_text[:500]}...", extra={"correlation_id": correlation_id})
                 # Fallback: Generate minimal analytical placeholders
                 raise
-            # except ValueError as e:
-            #     logger.error(f"Validation error in Bedrock output: {str(e)}. Raw output: {output_text[:500]}...", extra={"correlation_id": correlation_id})
-            #     raise
         except Exception as e:
             retry_count += 1
             if retry_count > max_retries:
@@ -268,127 +366,13 @@ def call_bedrock(symbol_data, aggregates, correlation_id, context):
             time.sleep(delay)
             delay *= 2  # Exponential backoff
 
-# def store_analysis(run_id, output, symbol_data, event, correlation_id):
-#     """Store analysis and notification data in the same DynamoDB table."""
-#     dynamodb = boto3.resource("dynamodb")
-#     table = dynamodb.Table(TABLE_NAME)
-#     timestamp = datetime.datetime.utcnow().isoformat()
-
-#     # Log the raw event detail for debugging
-#     logger.info(f"Raw event detail: {event['detail']}", extra={"correlation_id": correlation_id})
-
-#     # Extract row counts from ingestor event
-#     if isinstance(event["detail"], (str, bytes, bytearray)):
-#         ingestor_detail = json.loads(event["detail"])
-#     else:
-#         ingestor_detail = event["detail"]  # Use as-is if already a dict
-#     valid_count = ingestor_detail.get("valid_count", 0)  # Processed count from ingestor
-#     invalid_count = ingestor_detail.get("invalid_count", 0)  # Rejected count from ingestor
-#     raw_count = valid_count + invalid_count  # Total input records
-
-#     # Extract key anomalies
-#     key_anomalies = {symbol: analysis["key_anomaly"] for symbol, analysis in output.get("symbols", {}).items() if analysis["key_anomaly"] != "None"}
-
-#     # Single item combining full analysis and notification data
-#     item = {
-#         "analysis_id": run_id,
-#         "symbols_analyzed": list(symbol_data.keys()),
-#         "insights": {
-#             symbol: {
-#                 **analysis,
-#                 "latest_close": str(symbol_data.get("metrics", {}).get("latest_close", "N/A")),
-#                 "trend": symbol_data.get("metrics", {}).get("trend", "unknown"),
-#                 "momentum": str(symbol_data.get("metrics", {}).get("momentum", None)) if symbol_data.get("metrics", {}).get("momentum") is not None else None,
-#                 "volatility": str(symbol_data.get("metrics", {}).get("volatility", 0.0)),
-#                 "anomalies": symbol_data.get("metrics", {}).get("anomalies", []),
-#                 "percent_change": str(symbol_data.get("metrics", {}).get("percent_change", 0.0))
-#             } for symbol, analysis in output.get("symbols", {}).items()
-#         },
-#         "aggregates": compute_aggregates(symbol_data),
-#         "executive_summary": output.get("executive_summary", "No comprehensive summary generated."),
-#         "key_anomalies": key_anomalies,
-#         "row_counts": {
-#             "raw": raw_count,
-#             "processed": valid_count,
-#             "rejected": invalid_count
-#         },
-#         "processed_at": timestamp,
-#         "correlation_id": correlation_id
-#     }
-#     try:
-#         table.put_item(Item=item)
-#         logger.info(f"Stored analysis and notification data: {run_id}", extra={"correlation_id": correlation_id})
-#     except Exception as e:
-#         logger.error(f"Error writing to DynamoDB: {str(e)}", extra={"correlation_id": correlation_id})
-#         raise
-
-# def store_analysis(run_id, output, symbol_data, event, correlation_id):
-#     """Store analysis and notification data in the same DynamoDB table."""
-#     # Lazy init: Create resource here, only when function is called
-#     dynamodb = boto3.resource("dynamodb")
-#     # Check for required env var (fail fast if missing in Lambda runtime)
-#     if not TABLE_NAME:
-#         raise ValueError("TABLE_NAME environment variable is required")
-    
-#     table = dynamodb.Table(TABLE_NAME)
-#     timestamp = datetime.datetime.utcnow().isoformat()
-
-#     # Log the raw event detail for debugging
-#     logger.info(f"Raw event detail: {event['detail']}", extra={"correlation_id": correlation_id})
-
-#     # Extract row counts from ingestor event
-#     if isinstance(event["detail"], (str, bytes, bytearray)):
-#         ingestor_detail = json.loads(event["detail"])
-#     else:
-#         ingestor_detail = event["detail"]  # Use as-is if already a dict
-#     valid_count = ingestor_detail.get("valid_count", 0)  # Processed count from ingestor
-#     invalid_count = ingestor_detail.get("invalid_count", 0)  # Rejected count from ingestor
-#     raw_count = valid_count + invalid_count  # Total input records
-
-#     # Extract key anomalies
-#     key_anomalies = {symbol: analysis["key_anomaly"] for symbol, analysis in output.get("symbols", {}).items() if analysis["key_anomaly"] != "None"}
-
-#     # Single item combining full analysis and notification data
-#     item = {
-#         "analysis_id": run_id,
-#         "symbols_analyzed": list(symbol_data.keys()),
-#         "insights": {
-#             symbol: {
-#                 **analysis,
-#                 "latest_close": str(symbol_data[symbol]["metrics"].get("latest_close", "N/A")),  # Fixed: Use symbol_data[symbol] instead of .get("metrics")
-#                 "trend": symbol_data[symbol]["metrics"].get("trend", "unknown"),
-#                 "momentum": str(symbol_data[symbol]["metrics"].get("momentum", None)) if symbol_data[symbol]["metrics"].get("momentum") is not None else None,
-#                 "volatility": str(symbol_data[symbol]["metrics"].get("volatility", 0.0)),
-#                 "anomalies": symbol_data[symbol]["metrics"].get("anomalies", []),
-#                 "percent_change": str(symbol_data[symbol]["metrics"].get("percent_change", 0.0))
-#             } for symbol, analysis in output.get("symbols", {}).items()
-#         },
-#         "aggregates": compute_aggregates(symbol_data),
-#         "executive_summary": output.get("executive_summary", "No comprehensive summary generated."),
-#         "key_anomalies": key_anomalies,
-#         "row_counts": {
-#             "raw": raw_count,
-#             "processed": valid_count,
-#             "rejected": invalid_count
-#         },
-#         "processed_at": timestamp,
-#         "correlation_id": correlation_id
-#     }
-#     try:
-#         table.put_item(Item=item)
-#         logger.info(f"Stored analysis and notification data: {run_id}", extra={"correlation_id": correlation_id})
-#     except Exception as e:
-#         logger.error(f"Error writing to DynamoDB: {str(e)}", extra={"correlation_id": correlation_id})
-#         raise
-
-
-def store_analysis(run_id, output, symbol_data, event, correlation_id):
+def _to_decimal(value):
+    """Convert a metric to Decimal, DynamoDB's native number type; None stays None."""
+    return Decimal(str(value)) if value is not None else None
+
+def store_analysis(run_id, output, symbol_data, aggregates, event, correlation_id):
     """Store analysis and notification data in the same DynamoDB table."""
-    dynamodb = boto3.resource("dynamodb")
-    if not TABLE_NAME:
-        raise ValueError("TABLE_NAME environment variable is required")
-    
-    table = dynamodb.Table(TABLE_NAME)
+    table = _table()
     timestamp = datetime.datetime.utcnow().isoformat()
 
     # Log full event for debugging
@@ -414,12 +398,12 @@ def store_analysis(run_id, output, symbol_data, event, correlation_id):
         # Fallback: Count records from S3 if counts are 0
         if valid_count == 0 and invalid_count == 0:
             try:
-                s3_client = boto3.client("s3")
+                s3_client = _s3()
                 bucket = ingestor_detail.get("bucket", {}).get("name")
                 key = ingestor_detail.get("key")
                 if bucket and key:
                     obj = s3_client.get_object(Bucket=bucket, Key=key)
-                    records = [json.loads(line) for line in obj["Body"].read().decode("utf-8").splitlines()]
+                    records = [json.loads(line) for line in obj["Body"].iter_lines(chunk_size=_S3_CHUNK_SIZE) if line]
                     # Simplified fallback: assume all records are valid
                     valid_count = len(records)
                     invalid_count = 0
@@ -437,21 +421,24 @@ def store_analysis(run_id, output, symbol_data, event, correlation_id):
 
     key_anomalies = {symbol: analysis["key_anomaly"] for symbol, analysis in output.get("symbols", {}).items() if analysis["key_anomaly"] != "None"}
 
+    insights = {}
+    for symbol, analysis in output.get("symbols", {}).items():
+        metrics = symbol_data[symbol]["metrics"]
+        insights[symbol] = {
+            **analysis,
+            "latest_close": _to_decimal(metrics.get("latest_close")),
+            "trend": metrics.get("trend", "unknown"),
+            "momentum": _to_decimal(metrics.get("momentum")),
+            "volatility": _to_decimal(metrics.get("volatility", 0.0)),
+            "anomalies": metrics.get("anomalies", []),
+            "percent_change": _to_decimal(metrics.get("percent_change", 0.0))
+        }
+
     item = {
         "analysis_id": run_id,
         "symbols_analyzed": list(symbol_data.keys()),
-        "insights": {
-            symbol: {
-                **analysis,
-                "latest_close": str(symbol_data[symbol]["metrics"].get("latest_close", "N/A")),
-                "trend": symbol_data[symbol]["metrics"].get("trend", "unknown"),
-                "momentum": str(symbol_data[symbol]["metrics"].get("momentum", None)) if symbol_data[symbol]["metrics"].get("momentum") is not None else None,
-                "volatility": str(symbol_data[symbol]["metrics"].get("volatility", 0.0)),
-                "anomalies": symbol_data[symbol]["metrics"].get("anomalies", []),
-                "percent_change": str(symbol_data[symbol]["metrics"].get("percent_change", 0.0))
-            } for symbol, analysis in output.get("symbols", {}).items()
-        },
-        "aggregates": compute_aggregates(symbol_data),
+        "insights": insights,
+        "aggregates": aggregates,
         "executive_summary": output.get("executive_summary", "No comprehensive summary generated."),
         "key_anomalies": key_anomalies,
         "row_counts": {
@@ -473,39 +460,43 @@ def lambda_handler(event, context):
     correlation_id = str(uuid.uuid4())
     run_id = f"RUN#{datetime.datetime.utcnow().isoformat()}"
 
-    logger.handlers[0].formatter._style._fmt = "%(message)s"
     logger.info(f"Lambda invocation started, run_id={run_id}", extra={"correlation_id": correlation_id})
 
     try:
-        # Lazy init
-        s3_client = boto3.client("s3")
+        s3_client = _s3()
 
         # Extract bucket and key from EventBridge event triggered by ingestor
         bucket = event["detail"]["bucket"]["name"]
         key = event["detail"]["key"]
         obj = s3_client.get_object(Bucket=bucket, Key=key)
-        records = [json.loads(line) for line in obj["Body"].read().decode("utf-8").splitlines()]
+        # Stream the JSONL body line by line instead of materializing the whole object
+        records = [json.loads(line) for line in obj["Body"].iter_lines(chunk_size=_S3_CHUNK_SIZE) if line]
         logger.info(f"Read {len(records)} records from {key}", extra={"correlation_id": correlation_id})
 
         # Group records by symbol with error handling
-        symbol_data = {}
+        grouped = defaultdict(list)
         for record in records:
-            symbol = record.get("symbol", "unknown")
-            if symbol not in symbol_data:
-                symbol_data[symbol] = {"values": [], "interval": record.get("interval", "unknown")}
-            symbol_data[symbol]["values"].append(record)
-        for symbol in symbol_data:
+            _coerce_ohlcv(record)
+            grouped[record.get("symbol", "unknown")].append(record)
+        # Sort each symbol newest first once; compute_metrics and call_bedrock both rely on this order
+        for values in grouped.values():
+            values.sort(key=lambda x: x.get("datetime", ""), reverse=True)
+        symbol_data = {
+            symbol: {"values": values, "interval": values[0].get("interval", "unknown")}
+            for symbol, values in grouped.items()
+        }
+        for symbol, data in symbol_data.items():
             try:
-                symbol_data[symbol]["metrics"] = compute_metrics(symbol_data[symbol]["values"])
+                data["metrics"] = compute_metrics(data["values"], correlation_id)
             except Exception as e:
                 logger.error(f"Failed to compute metrics for symbol {symbol}: {str(e)}", extra={"correlation_id": correlation_id})
-                symbol_data[symbol]["metrics"] = compute_metrics([])  # Fallback to empty data
+                data["metrics"] = compute_metrics([], correlation_id)  # Fallback to empty data
 
         # Compute aggregates early for Bedrock prompt
         aggregates = compute_aggregates(symbol_data)
 
         output = call_bedrock(symbol_data, aggregates, correlation_id, context)
-        store_analysis(run_id, output, symbol_data, event, correlation_id)
+        store_analysis(run_id, output, symbol_data, aggregates, event, correlation_id)
 
         return {"statusCode": 200, "body": json.dumps({"correlation_id": correlation_id, "run_id": run_id})}
     except Exception as e:
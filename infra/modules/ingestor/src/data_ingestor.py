@@ -1,10 +1,15 @@
+import io
 import json
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import logging
 import datetime
+import functools
 import uuid
 import urllib.parse
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging for JSON format
 logger = logging.getLogger()
@@ -24,13 +29,38 @@ handler = logging.StreamHandler()
 handler.setFormatter(JSONFormatter())
 logger.addHandler(handler)
 
-s3_client = boto3.client('s3')
-events_client = boto3.client('events')
+# The Lambda runtime installs its own root handler before this module is imported;
+# strip its "[LEVEL]\t<timestamp>\t<request id>" prefix once, here, rather than per invocation
+_runtime_handler = next((h for h in logger.handlers if h is not handler and h.formatter is not None), None)
+if _runtime_handler is not None:
+    _runtime_handler.formatter._style._fmt = '%(message)s'
+
+# Shared by all clients: larger pool for concurrent S3 writes, keepalive and adaptive retries
+_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+    tcp_keepalive=True
+)
+s3_client = boto3.client('s3', config=_CLIENT_CONFIG)
+events_client = boto3.client('events', config=_CLIENT_CONFIG)
 PROCESSED_PREFIX = 'processed/'
 REJECTS_PREFIX = 'rejects/'
 HASHES_PREFIX = 'processed/hashes/'
 
-cloudwatch = boto3.client("cloudwatch")
+# Bodies above this size go through the managed transfer (parallel multipart parts / ranged GETs)
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=10,
+    use_threads=True
+)
+
+cloudwatch = boto3.client("cloudwatch", config=_CLIENT_CONFIG)
+
+REQUIRED_FIELDS = ('datetime', 'open', 'high', 'low', 'close', 'volume')
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+REQUIRED_META_FIELDS = ('symbol', 'interval', 'currency')
 
 def publish_reject_metric(valid_count, invalid_count, correlation_id=None):
     total = valid_count + invalid_count
@@ -60,25 +90,32 @@ def publish_reject_metric(valid_count, invalid_count, correlation_id=None):
 
 
 
+@functools.lru_cache(maxsize=4096)
+def _is_valid_date(dt):
+    """Checks a YYYY-MM-DD string; cached because the same dates repeat across symbols."""
+    try:
+        datetime.datetime.strptime(dt, '%Y-%m-%d')
+        return True
+    except ValueError:
+        return False
+
 def validate_record(symbol, record):
     """
     Validates a single stock record.
     Returns (is_valid, error_message)
     """
-    required_fields = ['datetime', 'open', 'high', 'low', 'close', 'volume']
     try:
-        if not all(field in record for field in required_fields):
-            return False, f"Missing required fields: {set(required_fields) - set(record.keys())}"
+        if not all(field in record for field in REQUIRED_FIELDS):
+            return False, f"Missing required fields: {set(REQUIRED_FIELDS) - set(record.keys())}"
         
         dt = record['datetime']
         if not isinstance(dt, str):
             return False, f"Invalid datetime format: {dt}"
-        try:
-            datetime.datetime.strptime(dt, '%Y-%m-%d')
-        except ValueError:
+        if not _is_valid_date(dt):
             return False, f"Invalid datetime format: {dt}"
         
-        for price in ['open', 'high', 'low', 'close']:
+        prices = []
+        for price in PRICE_FIELDS:
             val = record[price]
             if not isinstance(val, str):
                 return False, f"{price} is not a string: {val}"
@@ -86,6 +123,7 @@ def validate_record(symbol, record):
                 float_val = float(val)
                 if float_val < 0:
                     return False, f"{price} cannot be negative: {val}"
+                prices.append(float_val)
             except ValueError:
                 return False, f"{price} is not a valid float: {val}"
         
@@ -100,10 +138,7 @@ def validate_record(symbol, record):
             return False, f"volume is not a valid integer: {vol}"
         
         # Basic sanity checks for stock data
-        open_p = float(record['open'])
-        high_p = float(record['high'])
-        low_p = float(record['low'])
-        close_p = float(record['close'])
+        open_p, high_p, low_p, close_p = prices  # parsed above, in PRICE_FIELDS order
         
         if not (low_p <= open_p <= high_p and low_p <= close_p <= high_p):
             return False, "OHLC values do not satisfy low <= open/high/close <= high"
@@ -122,6 +157,7 @@ def process_stock_data(data, correlation_id):
     """
     valid_records = []
     invalid_records = []
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
     
     logger.info("Starting data processing", extra={'correlation_id': correlation_id})
     
@@ -131,24 +167,33 @@ def process_stock_data(data, correlation_id):
             continue
         
         meta = symbol_data['meta']
-        if not all(key in meta for key in ['symbol', 'interval', 'currency']):
+        if not all(key in meta for key in REQUIRED_META_FIELDS):
             logger.warning(f"Invalid meta for {symbol}", extra={'correlation_id': correlation_id})
             continue
         
-        for value in symbol_data['values']:
-            # Flatten: add symbol to each record
-            record = {**value, 'symbol': symbol, 'interval': meta.get('interval','unknown')}
+        valid_before, invalid_before = len(valid_records), len(invalid_records)
+        interval = meta.get('interval','unknown')
+        for record in symbol_data['values']:
+            # Flatten: add symbol to each record (in place; the parsed input is not reused)
+            record['symbol'] = symbol
+            record['interval'] = interval
             is_valid, error = validate_record(symbol, record)
             
             if is_valid:
                 valid_records.append(record)
-                logger.info(f"Valid record processed for {symbol} on {record['datetime']}", extra={'correlation_id': correlation_id})
             else:
-                invalid_record = {**record, 'error': error}
-                invalid_records.append(invalid_record)
-                logger.warning(f"Invalid record for {symbol} on {record['datetime']}: {error}", extra={'correlation_id': correlation_id})
+                record['error'] = error
+                invalid_records.append(record)
+                if debug_enabled:
+                    logger.debug(f"Invalid record for {symbol} on {record.get('datetime')}: {error}", extra={'correlation_id': correlation_id})
+        
+        logger.info(f"Processed {symbol}: {len(valid_records) - valid_before} valid, {len(invalid_records) - invalid_before} invalid", extra={'correlation_id': correlation_id})
     
     logger.info(f"Processing complete: {len(valid_records)} valid, {len(invalid_records)} invalid", extra={'correlation_id': correlation_id})
+    if invalid_records:
+        # One line with a sample instead of a warning per rejected row
+        sample_errors = [f"{r['symbol']} on {r.get('datetime')}: {r['error']}" for r in invalid_records[:5]]
+        logger.warning(f"Rejected {len(invalid_records)} records, first errors: {sample_errors}", extra={'correlation_id': correlation_id})
     return valid_records, invalid_records
 
 def write_to_s3(records, bucket_name, prefix, filename, correlation_id):
@@ -163,16 +208,24 @@ def write_to_s3(records, bucket_name, prefix, filename, correlation_id):
     timestamp = datetime.datetime.utcnow().strftime('%Y%m%d_%H%M%S')
     key = f"{prefix}{filename}_{timestamp}.jsonl"
     
-    lines = [json.dumps(record) for record in records]
-    body = '\n'.join(lines).encode('utf-8')
+    body = '\n'.join([json.dumps(record) for record in records]).encode('utf-8')
     
     try:
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=key,
-            Body=body,
-            ContentType='application/json'
-        )
+        if len(body) > MULTIPART_THRESHOLD:
+            s3_client.upload_fileobj(
+                io.BytesIO(body),
+                bucket_name,
+                key,
+                ExtraArgs={'ContentType': 'application/json'},
+                Config=TRANSFER_CONFIG
+            )
+        else:
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=key,
+                Body=body,
+                ContentType='application/json'
+            )
         logger.info(f"Successfully wrote {len(records)} records to s3://{bucket_name}/{key}", extra={'correlation_id': correlation_id})
         return key
     except Exception as e:
@@ -188,11 +241,10 @@ def lambda_handler(event, context):
     Uses S3 marker files for deduplication, no DynamoDB.
     """
     correlation_id = str(uuid.uuid4())
-    
-    logger.handlers[0].formatter._style._fmt = '%(message)s'
+    log = logging.LoggerAdapter(logger, {'correlation_id': correlation_id})
     
     try:
-        logger.info("Lambda invocation started", extra={'correlation_id': correlation_id})
+        log.info("Lambda invocation started")
         
         # Extract bucket and key from S3 event
         if not event['Records']:
@@ -203,7 +255,7 @@ def lambda_handler(event, context):
         key = urllib.parse.unquote_plus(s3_record['object']['key'], encoding='utf-8')
         
         if not key.startswith('inputs/'):
-            logger.info(f"File {key} is not in inputs/ folder, skipping", extra={'correlation_id': correlation_id})
+            log.info(f"File {key} is not in inputs/ folder, skipping")
             return {
                 'statusCode': 200,
                 'body': json.dumps({
@@ -214,15 +266,17 @@ def lambda_handler(event, context):
                 })
             }
         
-        # Get ETag using HeadObject
-        response = s3_client.head_object(Bucket=bucket_name, Key=key)
-        etag = response['ETag'].strip('"')
+        # S3 notifications carry the ETag; only fall back to HeadObject when it is missing
+        etag = s3_record['object'].get('eTag')
+        if not etag:
+            etag = s3_client.head_object(Bucket=bucket_name, Key=key)['ETag']
+        etag = etag.strip('"')
         
         # Check if ETag was already processed
         hash_key = f"{HASHES_PREFIX}{etag}"
         try:
             s3_client.head_object(Bucket=bucket_name, Key=hash_key)
-            logger.info(f"File {key} with ETag {etag} already processed, skipping", extra={'correlation_id': correlation_id})
+            log.info(f"File {key} with ETag {etag} already processed, skipping")
             return {
                 'statusCode': 200,
                 'body': json.dumps({
@@ -238,25 +292,35 @@ def lambda_handler(event, context):
         
         # Download and process the file
         try:
-            response = s3_client.get_object(Bucket=bucket_name, Key=key)
-            raw_data = response['Body'].read().decode('utf-8')
-            data = json.loads(raw_data)
-            logger.info(f"Successfully downloaded and parsed {key}", extra={'correlation_id': correlation_id})
+            if s3_record['object'].get('size', 0) > MULTIPART_THRESHOLD:
+                buffer = io.BytesIO()
+                s3_client.download_fileobj(bucket_name, key, buffer, Config=TRANSFER_CONFIG)
+                data = json.loads(buffer.getvalue())
+            else:
+                response = s3_client.get_object(Bucket=bucket_name, Key=key)
+                data = json.loads(response['Body'].read())
+            log.info(f"Successfully downloaded and parsed {key}")
         except Exception as e:
-            logger.error(f"Error downloading or parsing file {key}: {str(e)}", extra={'correlation_id': correlation_id})
+            log.error(f"Error downloading or parsing file {key}: {str(e)}")
             raise
         
         valid_records, invalid_records = process_stock_data(data, correlation_id)
         filename = os.path.basename(key)
-        processed_key = write_to_s3(valid_records, bucket_name, PROCESSED_PREFIX, filename, correlation_id)
-        write_to_s3(invalid_records, bucket_name, REJECTS_PREFIX, filename, correlation_id)
         
-        # Create marker file
+        # The two S3 writes are independent, so issue them concurrently; the metric,
+        # marker and event still wait until both writes have succeeded
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            processed_future = executor.submit(write_to_s3, valid_records, bucket_name, PROCESSED_PREFIX, filename, correlation_id)
+            rejects_future = executor.submit(write_to_s3, invalid_records, bucket_name, REJECTS_PREFIX, filename, correlation_id)
+        processed_key = processed_future.result()
+        rejects_future.result()
+        
         try:
             publish_reject_metric(len(valid_records), len(invalid_records), correlation_id)
         except Exception as e:
-            logger.error(f"Failed to publish reject metric: {str(e)}", extra={'correlation_id': correlation_id})
+            log.error(f"Failed to publish reject metric: {str(e)}")
 
+        # Create marker file
         try:
             s3_client.put_object(
                 Bucket=bucket_name,
@@ -266,14 +330,30 @@ def lambda_handler(event, context):
                     'processed_at': datetime.datetime.utcnow().isoformat(),
                     'correlation_id': correlation_id
                 }).encode('utf-8'),
-                ContentType='application/json'
+                ContentType='application/json',
+                IfNoneMatch='*'
             )
-            logger.info(f"Created marker file s3://{bucket_name}/{hash_key}", extra={'correlation_id': correlation_id})
+            log.info(f"Created marker file s3://{bucket_name}/{hash_key}")
+        except s3_client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] != 'PreconditionFailed':
+                log.error(f"Failed to create marker file: {str(e)}")
+                raise
+            # A concurrent invocation for the same ETag won the marker race; it publishes the event
+            log.info(f"File {key} with ETag {etag} already processed, skipping")
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'correlation_id': correlation_id,
+                    'message': f"File {key} with ETag {etag} already processed",
+                    'valid_count': 0,
+                    'invalid_count': 0
+                })
+            }
         except Exception as e:
-            logger.error(f"Failed to create marker file: {str(e)}", extra={'correlation_id': correlation_id})
+            log.error(f"Failed to create marker file: {str(e)}")
             raise
         
-        logger.info("Lambda processing completed successfully", extra={'correlation_id': correlation_id})
+        log.info("Lambda processing completed successfully")
 
         if processed_key:
             try:
@@ -286,20 +366,21 @@ def lambda_handler(event, context):
                     'filename': filename,
                     'processed_marker': hash_key
                 }
-                logger.info(f"EventBridge event detail: {json.dumps(event_detail, default=str)}", extra={'correlation_id': correlation_id})
+                detail = json.dumps(event_detail, default=str)
+                log.info(f"EventBridge event detail: {detail}")
                 events_client.put_events(
                     Entries=[
                         {
                             'Source': 'mejan.data-ingestor',
                             'DetailType': 'IngestorCompleted',
-                            'Detail': json.dumps(event_detail),
+                            'Detail': detail,
                             'EventBusName': 'default'
                         }
                     ]
                 )
-                logger.info(f"Published EventBridge event for s3://{bucket_name}/{processed_key}", extra={'correlation_id': correlation_id})
+                log.info(f"Published EventBridge event for s3://{bucket_name}/{processed_key}")
             except Exception as e:
-                logger.error(f"Failed to publish EventBridge event: {str(e)}", extra={'correlation_id': correlation_id})
+                log.error(f"Failed to publish EventBridge event: {str(e)}")
                 raise
 
         return {
@@ -312,5 +393,5 @@ def lambda_handler(event, context):
         }
     
     except Exception as e:
-        logger.error(f"Lambda failed: {str(e)}", extra={'correlation_id': correlation_id})
+        log.error(f"Lambda failed: {str(e)}")
         raise
\ No newline at end of file
@@ -4,13 +4,16 @@ import logging
 import datetime
 import uuid
 import os
+import string
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 
 
 class JSONFormatter(logging.Formatter):
     def format(self, record):
         log_entry = {
-            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "timestamp": datetime.datetime.utcfromtimestamp(record.created).isoformat(),
             "level": record.levelname,
             "message": record.getMessage(),
             "correlation_id": getattr(record, "correlation_id", None),
@@ -23,68 +26,69 @@ handler = logging.StreamHandler()
 handler.setFormatter(JSONFormatter())
 logger.addHandler(handler)
 
-# AWS clients
-ses_client = boto3.client("ses")
+def _preload_request_shapes(client, operation_name):
+    """Resolve an operation's request shapes, nested ones included, ahead of the first call."""
+    pending = [client.meta.service_model.operation_model(operation_name).input_shape]
+    seen = set()
+    while pending:
+        shape = pending.pop()
+        if shape is None or shape.name in seen:
+            continue
+        seen.add(shape.name)
+        if shape.type_name == "structure":
+            pending.extend(shape.members.values())
+        elif shape.type_name == "list":
+            pending.append(shape.member)
+        elif shape.type_name == "map":
+            pending.extend((shape.key, shape.value))
+
+# AWS clients; the pool is sized for concurrent sends from handler
+_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={"mode": "adaptive", "max_attempts": 5},
+    tcp_keepalive=True
+)
+ses_client = boto3.client("ses", config=_CLIENT_CONFIG)
+# Parse the SendEmail model during init instead of inside the first (billed) send
+_preload_request_shapes(ses_client, "SendEmail")
 
 # Constants
 TABLE_NAME = "mejan-StockAnalysis"
 EMAIL_SENDER = os.environ['SENDER_EMAIL']
 EMAIL_RECIPIENT = os.environ['RECEIVER_EMAIL']
+MAX_SEND_WORKERS = 10
+# Set SEND_HTML=0 to send text-only mail and skip rendering the HTML report
+SEND_HTML = os.environ.get('SEND_HTML', '1') == '1'
+
+def _parse_value(val):
+    """Deserialize one DynamoDB attribute value; unknown shapes are returned unchanged."""
+    if isinstance(val, dict):
+        for tag, v in val.items():
+            parse = _TYPE_PARSERS.get(tag)
+            if parse is not None:
+                return parse(v)
+    return val
+
+# Type tag -> parser; numbers are kept as strings
+_TYPE_PARSERS = {
+    'S': lambda v: v,
+    'N': lambda v: v,
+    'B': lambda v: v,
+    'BOOL': lambda v: v,
+    'NULL': lambda v: None,
+    'SS': set,
+    'NS': set,
+    'BS': set,
+    'L': lambda v: [_parse_value(i) for i in v],
+    'M': lambda v: {k: _parse_value(i) for k, i in v.items()},
+}
 
 def deserialize_dynamodb_item(item):
     """Convert DynamoDB item to Python dict, handling nested structures."""
-    def parse_value(val):
-        if isinstance(val, dict):
-            for k, v in val.items():
-                if k in ('S', 'N', 'BOOL'):
-                    return v
-                elif k == 'L':
-                    return [parse_value(i) for i in v]
-                elif k == 'M':
-                    return {vk: parse_value(vv) for vk, vv in v.items()}
-                elif k == 'NULL':
-                    return None
-        return val
-    return {k: parse_value(v) for k, v in item.items()}
-
-def create_html_email(analysis_id, row_counts, key_anomalies, executive_summary, aggregates):
-    """Create a visually appealing HTML email template."""
-    
-   # Format timestamp
-    current_time = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-    
-    # Calculate total processed percentage
-    total_raw = int(row_counts.get('raw', 0))  # Convert to int
-    processed = int(row_counts.get('processed', 0))  # Convert to int
-    rejected = int(row_counts.get('rejected', 0))  # Convert to int
-    
-    processed_pct = (processed / total_raw * 100) if total_raw > 0 else 0
-    rejected_pct = (rejected / total_raw * 100) if total_raw > 0 else 0
-    
-    # Format anomalies HTML
-    anomalies_html = ""
-    if key_anomalies:
-        for symbol, desc in key_anomalies.items():
-            anomalies_html += f"""
-            <div style="background: #fff3cd; border-left: 4px solid #ffc107; padding: 10px; margin: 8px 0; border-radius: 4px;">
-                <strong style="color: #856404;">{symbol}:</strong>
-                <span style="color: #856404;">{desc}</span>
-            </div>
-            """
-    else:
-        anomalies_html = '<div style="color: #28a745; font-style: italic;">No significant anomalies detected.</div>'
-    
-    # Format aggregates HTML
-    aggregates_html = ""
-    if aggregates:
-        for agg in aggregates[:5]:  # Limit to first 5 aggregates
-            aggregates_html += f'<li style="margin: 5px 0; color: #495057;">{agg}</li>'
-        if len(aggregates) > 5:
-            aggregates_html += f'<li style="color: #6c757d; font-style: italic;">... and {len(aggregates) - 5} more</li>'
-    else:
-        aggregates_html = '<li style="color: #6c757d; font-style: italic;">No aggregates available</li>'
+    return {k: _parse_value(v) for k, v in item.items()}
 
-    html_template = f"""
+# Static email skeleton, parsed once at import; create_html_email only fills in the placeholders
+_HTML_TEMPLATE = string.Template("""
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -102,8 +106,8 @@ def create_html_email(analysis_id, row_counts, key_anomalies, executive_summary,
                         <tr>
                             <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px 40px; text-align: center;">
                                 <h1 style="color: #ffffff; margin: 0; font-size: 28px; font-weight: 600;">📈 Stock Analysis Report</h1>
-                                <p style="color: #e8ecff; margin: 10px 0 0 0; font-size: 16px;">Analysis ID: {analysis_id}</p>
-                                <p style="color: #c8d0ff; margin: 5px 0 0 0; font-size: 14px;">{current_time}</p>
+                                <p style="color: #e8ecff; margin: 10px 0 0 0; font-size: 16px;">Analysis ID: $analysis_id</p>
+                                <p style="color: #c8d0ff; margin: 5px 0 0 0; font-size: 14px;">$current_time</p>
                             </td>
                         </tr>
                         
@@ -115,26 +119,26 @@ def create_html_email(analysis_id, row_counts, key_anomalies, executive_summary,
                                 <table width="100%" cellpadding="0" cellspacing="0" style="margin-bottom: 20px;">
                                     <tr>
                                         <td style="width: 33.33%; text-align: center; padding: 15px; background-color: #e8f4fd; border-radius: 6px; margin-right: 5px;">
-                                            <div style="font-size: 24px; font-weight: bold; color: #2980b9;">{total_raw:,}</div>
+                                            <div style="font-size: 24px; font-weight: bold; color: #2980b9;">$total_raw</div>
                                             <div style="color: #34495e; font-size: 14px;">Total Records</div>
                                         </td>
                                         <td style="width: 5px;"></td>
                                         <td style="width: 33.33%; text-align: center; padding: 15px; background-color: #d4edda; border-radius: 6px;">
-                                            <div style="font-size: 24px; font-weight: bold; color: #27ae60;">{processed:,}</div>
-                                            <div style="color: #34495e; font-size: 14px;">Processed ({processed_pct:.1f}%)</div>
+                                            <div style="font-size: 24px; font-weight: bold; color: #27ae60;">$processed</div>
+                                            <div style="color: #34495e; font-size: 14px;">Processed ($processed_pct%)</div>
                                         </td>
                                         <td style="width: 5px;"></td>
                                         <td style="width: 33.33%; text-align: center; padding: 15px; background-color: #f8d7da; border-radius: 6px;">
-                                            <div style="font-size: 24px; font-weight: bold; color: #e74c3c;">{rejected:,}</div>
-                                            <div style="color: #34495e; font-size: 14px;">Rejected ({rejected_pct:.1f}%)</div>
+                                            <div style="font-size: 24px; font-weight: bold; color: #e74c3c;">$rejected</div>
+                                            <div style="color: #34495e; font-size: 14px;">Rejected ($rejected_pct%)</div>
                                         </td>
                                     </tr>
                                 </table>
                                 
                                 <!-- Progress Bar -->
                                 <div style="background-color: #ecf0f1; border-radius: 10px; overflow: hidden; height: 20px; margin-bottom: 20px;">
-                                    <div style="width: {processed_pct:.1f}%; height: 100%; background: linear-gradient(90deg, #2ecc71, #27ae60); float: left;"></div>
-                                    <div style="width: {rejected_pct:.1f}%; height: 100%; background: linear-gradient(90deg, #e74c3c, #c0392b); float: left;"></div>
+                                    <div style="width: $processed_pct%; height: 100%; background: linear-gradient(90deg, #2ecc71, #27ae60); float: left;"></div>
+                                    <div style="width: $rejected_pct%; height: 100%; background: linear-gradient(90deg, #e74c3c, #c0392b); float: left;"></div>
                                 </div>
                             </td>
                         </tr>
@@ -143,7 +147,7 @@ def create_html_email(analysis_id, row_counts, key_anomalies, executive_summary,
                         <tr>
                             <td style="padding: 0 40px 20px 40px;">
                                 <h2 style="color: #2c3e50; margin: 0 0 15px 0; font-size: 20px; border-bottom: 2px solid #f39c12; padding-bottom: 10px;">⚠️ Key Anomalies</h2>
-                                {anomalies_html}
+                                $anomalies_html
                             </td>
                         </tr>
                         
@@ -152,7 +156,7 @@ def create_html_email(analysis_id, row_counts, key_anomalies, executive_summary,
                             <td style="padding: 0 40px 20px 40px;">
                                 <h2 style="color: #2c3e50; margin: 0 0 15px 0; font-size: 20px; border-bottom: 2px solid #9b59b6; padding-bottom: 10px;">📋 Key Aggregates</h2>
                                 <ul style="list-style: none; padding: 0; margin: 0;">
-                                    {aggregates_html}
+                                    $aggregates_html
                                 </ul>
                             </td>
                         </tr>
@@ -162,7 +166,7 @@ def create_html_email(analysis_id, row_counts, key_anomalies, executive_summary,
                             <td style="padding: 0 40px 30px 40px;">
                                 <h2 style="color: #2c3e50; margin: 0 0 15px 0; font-size: 20px; border-bottom: 2px solid #1abc9c; padding-bottom: 10px;">🎯 Executive Summary</h2>
                                 <div style="background-color: #f8fffe; border-left: 4px solid #1abc9c; padding: 20px; border-radius: 4px; line-height: 1.6; color: #2c3e50;">
-                                    {executive_summary}
+                                    $executive_summary
                                 </div>
                             </td>
                         </tr>
@@ -185,32 +189,106 @@ def create_html_email(analysis_id, row_counts, key_anomalies, executive_summary,
         </table>
     </body>
     </html>
-    """
+    """)
+
+_ANOMALY_ROW_TEMPLATE = """
+            <div style="background: #fff3cd; border-left: 4px solid #ffc107; padding: 10px; margin: 8px 0; border-radius: 4px;">
+                <strong style="color: #856404;">{symbol}:</strong>
+                <span style="color: #856404;">{desc}</span>
+            </div>
+            """
+_AGGREGATE_ROW_TEMPLATE = '<li style="margin: 5px 0; color: #495057;">{agg}</li>'
+
+def _format_generated_at():
+    """Current UTC time as shown in the email bodies."""
+    return datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+
+def create_html_email(analysis_id, row_counts, key_anomalies, executive_summary, aggregates, generated_at=None):
+    """Create a visually appealing HTML email template."""
+    
+   # Format timestamp
+    current_time = generated_at or _format_generated_at()
+    
+    # Calculate total processed percentage
+    total_raw = int(row_counts.get('raw', 0))  # Convert to int
+    processed = int(row_counts.get('processed', 0))  # Convert to int
+    rejected = int(row_counts.get('rejected', 0))  # Convert to int
+    
+    processed_pct = (processed / total_raw * 100) if total_raw > 0 else 0
+    rejected_pct = (rejected / total_raw * 100) if total_raw > 0 else 0
+    
+    # Format anomalies HTML
+    if key_anomalies:
+        anomalies_html = "".join([_ANOMALY_ROW_TEMPLATE.format(symbol=symbol, desc=desc) for symbol, desc in key_anomalies.items()])
+    else:
+        anomalies_html = '<div style="color: #28a745; font-style: italic;">No significant anomalies detected.</div>'
     
-    return html_template
+    # Format aggregates HTML
+    if aggregates:
+        rows = [_AGGREGATE_ROW_TEMPLATE.format(agg=agg) for agg in aggregates[:5]]  # Limit to first 5 aggregates
+        if len(aggregates) > 5:
+            rows.append(f'<li style="color: #6c757d; font-style: italic;">... and {len(aggregates) - 5} more</li>')
+        aggregates_html = "".join(rows)
+    else:
+        aggregates_html = '<li style="color: #6c757d; font-style: italic;">No aggregates available</li>'
+
+    return _HTML_TEMPLATE.substitute(
+        analysis_id=analysis_id,
+        current_time=current_time,
+        total_raw=f"{total_raw:,}",
+        processed=f"{processed:,}",
+        processed_pct=f"{processed_pct:.1f}",
+        rejected=f"{rejected:,}",
+        rejected_pct=f"{rejected_pct:.1f}",
+        anomalies_html=anomalies_html,
+        aggregates_html=aggregates_html,
+        executive_summary=executive_summary,
+    )
 
-def send_notification(correlation_id, analysis_id, row_counts, key_anomalies, executive_summary, aggregates):
+def send_notification(correlation_id, analysis_id, row_counts, key_anomalies, executive_summary, aggregates, generated_at=None):
     """Send SES email with enhanced HTML formatting."""
     try:
-        # Create HTML email content
-        html_body = create_html_email(analysis_id, row_counts, key_anomalies, executive_summary, aggregates)
-        
-        # Create plain text fallback
-        counts_text = (f"Raw: {row_counts.get('raw', 0)}, "
-                       f"Processed: {row_counts.get('processed', 0)}, "
-                       f"Rejected: {row_counts.get('rejected', 0)}")
-        
-        anomalies_text = "\n".join([f"{symbol}: {desc}" for symbol, desc in key_anomalies.items()]) or "No significant anomalies detected."
-        aggregates_text = "\n".join([f"• {agg}" for agg in aggregates]) if aggregates else "No aggregates available."
-        
-        plain_text_body = (f"Stock Analysis Report (Analysis ID: {analysis_id})\n"
-                          f"Generated: {datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}\n\n"
-                          f"DATA PROCESSING SUMMARY:\n{counts_text}\n\n"
-                          f"KEY ANOMALIES:\n{anomalies_text}\n\n"
-                          f"KEY AGGREGATES:\n{aggregates_text}\n\n"
-                          f"EXECUTIVE SUMMARY:\n{executive_summary}")
+        # Format the timestamp once for both bodies
+        generated_at = generated_at or _format_generated_at()
+
+        # Create plain text fallback, one line per list entry
+        lines = [
+            f"Stock Analysis Report (Analysis ID: {analysis_id})",
+            f"Generated: {generated_at}",
+            "",
+            "DATA PROCESSING SUMMARY:",
+            f"Raw: {row_counts.get('raw', 0)}, "
+            f"Processed: {row_counts.get('processed', 0)}, "
+            f"Rejected: {row_counts.get('rejected', 0)}",
+            "",
+            "KEY ANOMALIES:",
+        ]
+        if key_anomalies:
+            lines.extend([f"{symbol}: {desc}" for symbol, desc in key_anomalies.items()])
+        else:
+            lines.append("No significant anomalies detected.")
+        lines += ["", "KEY AGGREGATES:"]
+        if aggregates:
+            lines.extend([f"• {agg}" for agg in aggregates])
+        else:
+            lines.append("No aggregates available.")
+        lines += ["", "EXECUTIVE SUMMARY:", f"{executive_summary}"]
+        plain_text_body = "\n".join(lines)
+
+        body = {
+            "Text": {
+                "Data": plain_text_body,
+                "Charset": "UTF-8"
+            }
+        }
+        if SEND_HTML:
+            # Create HTML email content
+            body["Html"] = {
+                "Data": create_html_email(analysis_id, row_counts, key_anomalies, executive_summary, aggregates, generated_at),
+                "Charset": "UTF-8"
+            }
 
-        # Send email with both HTML and plain text
+        # Send email with HTML (unless disabled) and plain text
         response = ses_client.send_email(
             Source=EMAIL_SENDER,
             Destination={"ToAddresses": [EMAIL_RECIPIENT]},
@@ -219,60 +297,64 @@ def send_notification(correlation_id, analysis_id, row_counts, key_anomalies, ex
                     "Data": f"📈 Stock Analysis Report - {analysis_id}",
                     "Charset": "UTF-8"
                 },
-                "Body": {
-                    "Html": {
-                        "Data": html_body,
-                        "Charset": "UTF-8"
-                    },
-                    "Text": {
-                        "Data": plain_text_body,
-                        "Charset": "UTF-8"
-                    }
-                }
+                "Body": body
             }
         )
         
-        logger.info(f"Enhanced SES email sent successfully for analysis_id={analysis_id}, MessageId={response['MessageId']}", 
+        logger.info("Enhanced SES email sent successfully for analysis_id=%s, MessageId=%s", analysis_id, response['MessageId'],
                    extra={"correlation_id": correlation_id})
         return True
         
     except ClientError as e:
         error_code = e.response['Error']['Code']
-        logger.error(f"Failed to send SES email: {str(e)}, error_code={error_code}", 
+        logger.error("Failed to send SES email: %s, error_code=%s", e, error_code,
                     extra={"correlation_id": correlation_id, "analysis_id": analysis_id})
         if error_code == 'MessageRejected':
-            logger.error(f"Ensure {EMAIL_SENDER} is verified in SES and has permission to send HTML emails", 
+            logger.error("Ensure %s is verified in SES and has permission to send HTML emails", EMAIL_SENDER,
                         extra={"correlation_id": correlation_id, "analysis_id": analysis_id})
         raise  # Trigger Lambda retry
 
+def process_record(record, event_count, generated_at=None):
+    """Deserialize one DynamoDB Stream INSERT and send its notification."""
+    item = {}
+    try:
+        # Deserialize DynamoDB item
+        item = deserialize_dynamodb_item(record['dynamodb']['NewImage'])
+        analysis_id = item.get('analysis_id', 'unknown')
+        correlation_id = item.get('correlation_id') or str(uuid.uuid4())
+        logger.info("Processing DynamoDB Stream event, analysis_id=%s, event_count=%d", analysis_id, event_count,
+                   extra={"correlation_id": correlation_id})
+
+        # Extract required fields
+        row_counts = item.get('row_counts', {'raw': 0, 'processed': 0, 'rejected': 0})
+        key_anomalies = item.get('key_anomalies', {})
+        executive_summary = item.get('executive_summary', 'No summary available.')
+        aggregates = item.get('aggregates', [])
+
+        # Send enhanced HTML email for every INSERT event
+        logger.info("Triggering enhanced notification for analysis_id=%s", analysis_id,
+                   extra={"correlation_id": correlation_id})
+        send_notification(correlation_id, analysis_id, row_counts, key_anomalies, executive_summary, aggregates, generated_at)
+
+    except Exception as e:
+        logger.error("Error processing record for analysis_id=%s: %s", item.get('analysis_id', 'unknown'), e,
+                    extra={"correlation_id": item.get('correlation_id', 'unknown')})
+        raise
+
 def handler(event, context):
+    inserts = []
     for record in event['Records']:
         if record['eventName'] != 'INSERT':
-            logger.info(f"Skipping non-INSERT event: {record['eventName']}", extra={"correlation_id": "unknown"})
+            logger.info("Skipping non-INSERT event: %s", record['eventName'], extra={"correlation_id": "unknown"})
             continue
+        inserts.append(record)
 
-        try:
-            # Deserialize DynamoDB item
-            item = deserialize_dynamodb_item(record['dynamodb']['NewImage'])
-            analysis_id = item.get('analysis_id', 'unknown')
-            correlation_id = item.get('correlation_id', str(uuid.uuid4()))
-            logger.info(f"Processing DynamoDB Stream event, analysis_id={analysis_id}, event_count={len(event['Records'])}", 
-                       extra={"correlation_id": correlation_id})
-
-            # Extract required fields
-            row_counts = item.get('row_counts', {'raw': 0, 'processed': 0, 'rejected': 0})
-            key_anomalies = item.get('key_anomalies', {})
-            executive_summary = item.get('executive_summary', 'No summary available.')
-            aggregates = item.get('aggregates', [])
-
-            # Send enhanced HTML email for every INSERT event
-            logger.info(f"Triggering enhanced notification for analysis_id={analysis_id}", 
-                       extra={"correlation_id": correlation_id})
-            send_notification(correlation_id, analysis_id, row_counts, key_anomalies, executive_summary, aggregates)
-
-        except Exception as e:
-            logger.error(f"Error processing record for analysis_id={item.get('analysis_id', 'unknown')}: {str(e)}", 
-                        extra={"correlation_id": item.get('correlation_id', 'unknown')})
-            raise  # Trigger Lambda retry
+    # SES calls are network-bound; send them concurrently instead of one round trip after another
+    event_count = len(event['Records'])
+    generated_at = _format_generated_at()  # one timestamp for every email in the batch
+    with ThreadPoolExecutor(max_workers=MAX_SEND_WORKERS) as executor:
+        futures = [executor.submit(process_record, record, event_count, generated_at) for record in inserts]
+    for future in futures:
+        future.result()  # Re-raise the first failure to trigger Lambda retry
 
-    return {'statusCode': 200}
\ No newline at end of file
+    return {'statusCode': 200}
@@ -1,5 +1,5 @@
 import pytest
-from infra.modules.analyzer.src.data_analyzer import compute_metrics
+from infra.modules.analyzer.src.data_analyzer import compute_metrics, compute_aggregates
 
 
 def test_compute_metrics_uptrend():
@@ -43,3 +43,18 @@ def test_compute_metrics_anomaly_volume():
 
     # At least one anomaly about unusual trading volume
     assert any("Unusual trading volume" in anomaly for anomaly in metrics["anomalies"])
+
+
+def test_compute_aggregates_biggest_loser():
+    # Largest absolute move is negative; it must be reported as a loser.
+    # Average volume is weighted by bar count: (1 * 1M + 3 * 3M) / 4 bars = 2.5M
+    symbol_data = {
+        "AAPL": {"values": [{"volume": "1000000"}], "metrics": {"avg_volume": 1e6, "trend": "up", "momentum": 1.5, "volatility": 0.5, "percent_change": 2.0, "anomalies": []}},
+        "TSLA": {"values": [{"volume": "3000000"}] * 3, "metrics": {"avg_volume": 3e6, "trend": "down", "momentum": -4.0, "volatility": 2.5, "percent_change": -6.0, "anomalies": ["Sharp price movement on 2025-09-08"]}},
+    }
+    aggregates = compute_aggregates(symbol_data)
+
+    assert "Average trading volume across 2 stocks was 2.50M shares." in aggregates
+    assert "AAPL had the largest momentum with a 1.50 price change." in aggregates
+    assert "TSLA was the biggest loser with a 6.00% change." in aggregates
+    assert any(a.startswith("TSLA had the highest volatility") for a in aggregates)
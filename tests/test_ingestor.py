@@ -1,4 +1,9 @@
+import io
+import json
 import pytest
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from infra.modules.ingestor.src import data_ingestor
 from infra.modules.ingestor.src.data_ingestor import validate_record, process_stock_data
 
 def test_validate_record_valid():
@@ -58,4 +63,68 @@ def test_process_stock_data_valid_and_invalid():
     assert valid_records[0]["symbol"] == "AAPL"
     assert valid_records[0]["datetime"] == "2025-09-08"
     assert len(invalid_records) == 1
-    assert invalid_records[0]["error"] == "volume cannot be negative: -100"
\ No newline at end of file
+    assert invalid_records[0]["error"] == "volume cannot be negative: -100"
+
+def test_validate_record_invalid_datetime():
+    record = {
+        "datetime": "2025-13-08",
+        "open": "239.30000",
+        "high": "240.14999",
+        "low": "225.95000",
+        "close": "234.07000",
+        "volume": "304739300",
+        "symbol": "AAPL"
+    }
+    data_ingestor._is_valid_date.cache_clear()
+    is_valid, error = validate_record("AAPL", record)
+    assert is_valid is False
+    assert error == "Invalid datetime format: 2025-13-08"
+    hits = data_ingestor._is_valid_date.cache_info().hits
+
+    # The repeated date is served from the cache rather than parsed again
+    is_valid, error = validate_record("AAPL", record)
+    assert is_valid is False
+    assert error == "Invalid datetime format: 2025-13-08"
+    assert data_ingestor._is_valid_date.cache_info().hits == hits + 1
+
+
+def test_lambda_handler_skips_event_when_marker_already_written():
+    body = json.dumps({
+        "AAPL": {
+            "meta": {"symbol": "AAPL", "interval": "1week", "currency": "USD"},
+            "values": [
+                {"datetime": "2025-09-08", "open": "239.30000", "high": "240.14999",
+                 "low": "225.95000", "close": "234.07000", "volume": "304739300"},
+                {"datetime": "2025-09-01", "open": "229.25", "high": "241.32001",
+                 "low": "226.97000", "close": "239.69000", "volume": "-100"}
+            ]
+        }
+    }).encode("utf-8")
+    event = {"Records": [{"s3": {
+        "bucket": {"name": "test-bucket"},
+        "object": {"key": "inputs/stocks.json", "eTag": "abc123", "size": len(body)}
+    }}]}
+
+    with Stubber(data_ingestor.s3_client) as s3_stub, \
+            Stubber(data_ingestor.events_client) as events_stub, \
+            Stubber(data_ingestor.cloudwatch) as cloudwatch_stub:
+        s3_stub.add_client_error("head_object", service_error_code="404", http_status_code=404,
+                                 expected_params={"Bucket": "test-bucket", "Key": "processed/hashes/abc123"})
+        s3_stub.add_response("get_object", {"Body": StreamingBody(io.BytesIO(body), len(body))},
+                             expected_params={"Bucket": "test-bucket", "Key": "inputs/stocks.json"})
+        s3_stub.add_response("put_object", {})  # processed/ and rejects/ writes, issued concurrently
+        s3_stub.add_response("put_object", {})
+        cloudwatch_stub.add_response("put_metric_data", {})
+        # A concurrent invocation already created the marker
+        s3_stub.add_client_error("put_object", service_error_code="PreconditionFailed", http_status_code=412)
+
+        response = data_ingestor.lambda_handler(event, None)
+
+        s3_stub.assert_no_pending_responses()
+        events_stub.assert_no_pending_responses()  # nothing queued: any put_events call would fail
+
+    assert response["statusCode"] == 200
+    result = json.loads(response["body"])
+    assert result["valid_count"] == 0
+    assert result["invalid_count"] == 0
+    assert "already processed" in result["message"]
@@ -1,4 +1,5 @@
 import pytest
+from infra.modules.notifier.src import notifier_lambda
 from infra.modules.notifier.src.notifier_lambda import deserialize_dynamodb_item
 
 def test_deserialize_dynamodb_item_valid():
@@ -48,10 +49,38 @@ def test_deserialize_dynamodb_item_nested_list():
     ]
 
 
+def test_deserialize_dynamodb_item_set_types():
+    item = {
+        "symbols": {"SS": ["AAPL", "TSLA"]},
+        "volumes": {"NS": ["100", "200"]}
+    }
+    result = deserialize_dynamodb_item(item)
+    assert result["symbols"] == {"AAPL", "TSLA"}
+    assert result["volumes"] == {"100", "200"}
 
 
+def test_send_notification_text_only(monkeypatch):
+    sent = []
 
+    class FakeSES:
+        def send_email(self, **kwargs):
+            sent.append(kwargs)
+            return {"MessageId": "test-message"}
 
+    def fail_html(*args, **kwargs):
+        raise AssertionError("create_html_email must not be called when SEND_HTML is off")
 
+    monkeypatch.setattr(notifier_lambda, "SEND_HTML", False)
+    monkeypatch.setattr(notifier_lambda, "ses_client", FakeSES())
+    monkeypatch.setattr(notifier_lambda, "create_html_email", fail_html)
 
+    notifier_lambda.send_notification(
+        "test-id", "RUN#2025-09-08", {"raw": "2", "processed": "1", "rejected": "1"},
+        {"AAPL": "Unusual trading volume"}, "Summary.", ["AAPL had largest momentum"]
+    )
 
+    assert len(sent) == 1
+    body = sent[0]["Message"]["Body"]
+    assert "Text" in body
+    assert "Html" not in body
+    assert "AAPL: Unusual trading volume" in body["Text"]["Data"]